@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 import signal
-import sys
-import time
-from src.utils import ConfigLoader
-from src.core import ScreenAnalyzer
+import threading
+
+# 收到退出信号时置位，主线程在此等待而不是定时轮询
+_stop = threading.Event()
 
 def signal_handler(sig, frame):
     print("\nReceived interrupt signal. Shutting down...")
-    sys.exit(0)
+    _stop.set()
 
 def main():
     print("=" * 60)
@@ -19,6 +19,7 @@ def main():
     
     try:
         print("\n[1] Loading configuration...")
+        from src.utils import ConfigLoader
         config = ConfigLoader()
         rtsp_urls = config.get_rtsp_urls()
         detection_config = config.get_detection_config()
@@ -37,6 +38,8 @@ def main():
         print(f"  - Confidence threshold: {detection_config.get('confidence_threshold', 0.5)}")
         print(f"  - Analysis interval: {detection_config.get('analysis_interval', 0.5)}s")
         
+        # 延迟导入：检测相关的重量级依赖在配置校验通过后才加载
+        from src.core import ScreenAnalyzer
         analyzer = ScreenAnalyzer()  # 现在所有参数都从配置文件读取
         
         print("\n[3] Adding RTSP streams...")
@@ -51,8 +54,7 @@ def main():
         print("Analysis results will be saved to log/ directory")
         print("=" * 60 + "\n")
         
-        while True:
-            time.sleep(1)
+        _stop.wait()
             
     except KeyboardInterrupt:
         print("\nShutting down...")
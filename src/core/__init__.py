@@ -1,6 +1,26 @@
-from .rtsp_stream import RTSPStream
-from .screen_analyzer import ScreenAnalyzer
-from .device_state import DeviceStateManager, DeviceState
-from .device_notifier import DeviceNotifier
+import importlib
 
-__all__ = ['RTSPStream', 'ScreenAnalyzer', 'DeviceStateManager', 'DeviceState', 'DeviceNotifier']
\ No newline at end of file
+# 子模块按需导入：访问对应名称时才加载 cv2 / ultralytics 等重量级依赖
+_LAZY_ATTRS = {
+    'RTSPStream': '.rtsp_stream',
+    'ScreenAnalyzer': '.screen_analyzer',
+    'DeviceStateManager': '.device_state',
+    'DeviceState': '.device_state',
+    'DeviceNotifier': '.device_notifier',
+    'OnnxClassifier': '.onnx_classifier',
+}
+
+__all__ = ['RTSPStream', 'ScreenAnalyzer', 'DeviceStateManager', 'DeviceState', 'DeviceNotifier', 'OnnxClassifier']
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,22 +1,83 @@
-import requests
 import json
+import os
+import socket
 import time
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import Deque, Dict, Optional, Tuple
 import paho.mqtt.client as mqtt
+import urllib3
+from ..utils.log_files import LogFileCache
+
+
+# MQTT dismiss 消息模板，只有目标设备ID和时间戳会变化
+DISMISS_PAYLOAD_FMT = b'{"text":"","command":"dismiss","targetDeviceId":%s,"timestamp":"%s"}'
 
 
 class DeviceNotifier:
     """处理向设备发送状态变更通知"""
     
+    # 可以合并的通知类型（新的到来时取消尚未发送的旧通知）
+    # 101/102/106 是会话生命周期信号，必须按顺序全部送达，不能合并或丢弃
+    COALESCE_KINDS = ("mqtt_dismiss",)
+    # 经MQTT发送的通知类型，走共用的MQTT发送队列，broker不可用时不会拖住设备的HTTP通知
+    MQTT_KINDS = ("mqtt_dismiss",)
+    # 扫描通知去抖窗口（秒），窗口内的多次扫描合并为一次请求
+    SCAN_DEBOUNCE_SECONDS = 0.1
+    # 连续失败达到该次数后暂停向该设备发送HTTP请求
+    BREAKER_FAILURE_THRESHOLD = 3
+    BREAKER_MAX_OPEN_SECONDS = 60
+    # 发布dismiss前等待MQTT连接建立的最长时间（秒）
+    MQTT_CONNECT_WAIT = 3.0
+    
     def __init__(self, config_loader, logger=None):
         self.config_loader = config_loader
         self.logger = logger
+        self._devices: Dict[str, Dict] = {}
+        self._mqtt_cfg: Dict = {}
+        # 熔断器状态：设备ID -> (连续失败次数, 暂停发送截止时间(monotonic))
+        self._breaker: Dict[str, Tuple[int, float]] = {}
+        self._breaker_lock = threading.Lock()
+        # 每个设备的请求URL和请求头，首次使用时构建
+        self._device_endpoints: Dict[str, Tuple[str, Dict[str, str]]] = {}
+        # (命令代码, 消息) -> 已编码的请求体
+        self._encoded_bodies: Dict[Tuple[int, str], bytes] = {}
+        self._bind_config()
         self.timeout = 5  # HTTP请求超时时间（秒）
         self.log_dir = Path("log")
         self.log_dir.mkdir(exist_ok=True)
+        # 有外部logger时通知日志也交给它的写入线程，否则自行写文件
+        self._log_files = None if logger else LogFileCache()
+        # 复用同一个连接池，保持与设备的keep-alive连接
+        self._http = urllib3.PoolManager(
+            num_pools=16,
+            maxsize=32,
+            retries=False,
+            timeout=urllib3.Timeout(connect=1.0, read=self.timeout)
+        )
+        # 每个设备一个单线程执行器：不阻塞状态检测，同一设备的通知按提交顺序依次发送，
+        # 慢设备也只会拖慢自己的队列（MQTT通知另用一个共用的执行器）
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._pending: Dict[str, Deque[Tuple[str, Future]]] = defaultdict(deque)
+        self._pending_lock = threading.Lock()
+        self._closed = False
+        # 去抖中的扫描通知：设备ID -> (定时器, 扫描次数)
+        self._pending_scans: Dict[str, Tuple[threading.Timer, int]] = {}
+        self._scan_lock = threading.Lock()
+        # 常驻MQTT客户端，启动时即开始后台连接，保证第一条dismiss不会因尚未连接而丢失
+        self._mqtt: Optional[mqtt.Client] = None
+        self._mqtt_lock = threading.Lock()
+        self._mqtt_connected = threading.Event()
+        # 已JSON编码的目标设备ID
+        self._encoded_targets: Dict[str, bytes] = {}
+        mqtt_broker = self._mqtt_cfg.get('mqtt_broker')
+        if mqtt_broker:
+            self._get_mqtt_client(mqtt_broker, self._mqtt_cfg.get('mqtt_port', 1883))
         
-    def notify_device(self, device_id: str, code: int, message: str) -> bool:
+    def notify_device(self, device_id: str, code: int, message: str, extra: Optional[Dict] = None) -> bool:
         """
         向设备发送状态通知
         
@@ -24,64 +85,66 @@ class DeviceNotifier:
             device_id: 设备ID
             code: 命令代码
             message: 消息内容
+            extra: 附加到请求体的字段
             
         Returns:
             bool: 是否发送成功
         """
+        if self._breaker_open(device_id):
+            print(f"[DeviceNotifier] Skipping {device_id}: device unreachable (circuit open)")
+            self._log_notification(device_id, code, message, 0, "Circuit Open")
+            return False
+        
         try:
-            # 获取设备配置
-            devices_config = self.config_loader.config.get('device', {})
-            device_config = devices_config.get(device_id)
-            
-            if not device_config:
-                print(f"[DeviceNotifier] Device {device_id} not found in config")
-                return False
-            
-            # 获取设备IP
-            host_ip = device_config.get('hostip')
-            if not host_ip:
-                print(f"[DeviceNotifier] No hostip found for device {device_id}")
+            endpoint = self._get_endpoint(device_id)
+            if not endpoint:
                 return False
+            url, headers = endpoint
             
-            # 构建请求URL（使用端口9999）
-            url = f"http://{host_ip}:9999/selfregistration/"
-            
-            # 构建请求体
-            payload = {
-                "code": code,
-                "message": message
-            }
-            
-            # 构建请求头
-            headers = {
-                "Content-Type": "application/json",
-                "X-Device-ID": device_id
-            }
+            # 构建请求体（无附加字段时复用已编码的请求体）
+            body = None if extra else self._encoded_bodies.get((code, message))
+            if body is None:
+                payload = {
+                    "code": code,
+                    "message": message
+                }
+                if extra:
+                    payload.update(extra)
+                body = json.dumps(payload).encode('utf-8')
+                if not extra:
+                    self._encoded_bodies[(code, message)] = body
             
             # 发送请求
-            response = requests.post(
-                url,
-                json=payload,
-                headers=headers,
-                timeout=self.timeout
-            )
+            response = self._http.request('POST', url, body=body, headers=headers)
+            
+            # 设备可达，重置熔断器
+            self._record_success(device_id)
             
             # 记录到日志
-            self._log_notification(device_id, code, message, response.status_code, response.text)
+            response_text = response.data[:200].decode('utf-8', errors='replace')
+            self._log_notification(device_id, code, message, response.status, response_text)
             
-            if response.status_code == 200:
+            if response.status == 200:
                 print(f"[DeviceNotifier] Successfully notified {device_id} with code {code}")
                 return True
             else:
-                print(f"[DeviceNotifier] Failed to notify {device_id}: HTTP {response.status_code}")
+                print(f"[DeviceNotifier] Failed to notify {device_id}: HTTP {response.status}")
                 return False
                 
-        except requests.exceptions.Timeout:
+        except urllib3.exceptions.NewConnectionError:
+            # urllib3 2.x 中 NewConnectionError 是 ConnectTimeoutError 的子类，必须先于超时捕获
+            print(f"[DeviceNotifier] Connection error notifying device {device_id}")
+            self._record_failure(device_id)
+            self._log_notification(device_id, code, message, 0, "Connection Error")
+            return False
+        except urllib3.exceptions.TimeoutError:
             print(f"[DeviceNotifier] Timeout notifying device {device_id}")
+            self._record_failure(device_id)
             self._log_notification(device_id, code, message, 0, "Timeout")
             return False
-        except requests.exceptions.ConnectionError:
+        except urllib3.exceptions.HTTPError:
             print(f"[DeviceNotifier] Connection error notifying device {device_id}")
+            self._record_failure(device_id)
             self._log_notification(device_id, code, message, 0, "Connection Error")
             return False
         except Exception as e:
@@ -89,67 +152,272 @@ class DeviceNotifier:
             self._log_notification(device_id, code, message, 0, str(e))
             return False
     
-    def _log_notification(self, device_id: str, code: int, message: str, status_code: int, response: str):
-        """记录通知到日志文件"""
-        timestamp = datetime.now()
+    def _breaker_open(self, device_id: str) -> bool:
+        """设备是否处于熔断（暂停发送）状态"""
+        state = self._breaker.get(device_id)
+        return state is not None and state[1] > time.monotonic()
+    
+    def _record_success(self, device_id: str):
+        with self._breaker_lock:
+            self._breaker.pop(device_id, None)
+    
+    def _record_failure(self, device_id: str):
+        """记录一次连接失败，连续失败达到阈值后按指数退避暂停发送"""
+        with self._breaker_lock:
+            failures = self._breaker.get(device_id, (0, 0.0))[0] + 1
+            open_until = 0.0
+            if failures >= self.BREAKER_FAILURE_THRESHOLD:
+                open_seconds = min(self.BREAKER_MAX_OPEN_SECONDS, 2 ** failures)
+                open_until = time.monotonic() + open_seconds
+                print(f"[DeviceNotifier] {device_id} failed {failures} times, pausing notifications for {open_seconds}s")
+            self._breaker[device_id] = (failures, open_until)
+    
+    def refresh_config(self):
+        """重新读取配置文件并更新缓存的设备和MQTT配置"""
+        self.config_loader.config = self.config_loader.load_config()
+        self._bind_config()
+    
+    def _bind_config(self):
+        """缓存配置中的设备和MQTT设置，清空设备请求地址缓存"""
+        config = self.config_loader.config
+        self._devices = config.get('device', {})
+        self._mqtt_cfg = config.get('alter_neko', {})
+        self._device_endpoints = {}
+    
+    def _get_endpoint(self, device_id: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """获取设备的请求URL和请求头，配置缺失时返回None"""
+        endpoint = self._device_endpoints.get(device_id)
+        if endpoint:
+            return endpoint
+        
+        device_config = self._devices.get(device_id)
+        if not device_config:
+            print(f"[DeviceNotifier] Device {device_id} not found in config")
+            return None
+        
+        # 获取设备IP
+        host_ip = device_config.get('hostip')
+        if not host_ip:
+            print(f"[DeviceNotifier] No hostip found for device {device_id}")
+            return None
         
-        # 如果有外部logger，使用它
+        # 构建请求URL（使用端口9999）和请求头
+        endpoint = (
+            f"http://{host_ip}:9999/selfregistration/",
+            {"Content-Type": "application/json", "X-Device-ID": device_id}
+        )
+        self._device_endpoints[device_id] = endpoint
+        return endpoint
+    
+    def _submit(self, device_id: str, kind: str, fn, *args) -> Future:
+        """
+        将通知提交到串行发送队列：HTTP通知每个设备一个队列，MQTT通知共用一个队列
+        
+        只有 COALESCE_KINDS 中的通知会被合并（尚未发送的旧通知被取消），其余通知一律按顺序发送。
+        """
+        with self._pending_lock:
+            if self._closed:
+                raise RuntimeError("DeviceNotifier is closed")
+            lane = "mqtt" if kind in self.MQTT_KINDS else f"http_{device_id}"
+            executor = self._executors.get(lane)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"notif_{lane}")
+                self._executors[lane] = executor
+            
+            pending = self._pending[device_id]
+            # 清理已完成的通知
+            for item in [item for item in pending if item[1].done()]:
+                pending.remove(item)
+            
+            if kind in self.COALESCE_KINDS:
+                for item in [item for item in pending if item[0] == kind]:
+                    if item[1].cancel():
+                        pending.remove(item)
+            
+            future = executor.submit(fn, *args)
+            pending.append((kind, future))
+            return future
+    
+    def shutdown(self, wait: bool = False):
+        """停止所有设备的后台发送队列"""
+        with self._pending_lock:
+            self._closed = True
+            executors = list(self._executors.values())
+            self._executors.clear()
+            self._pending.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait, cancel_futures=True)
+    
+    def close(self):
+        """停止通知线程池，关闭HTTP连接池和MQTT连接"""
+        with self._scan_lock:
+            for timer, _ in self._pending_scans.values():
+                timer.cancel()
+            self._pending_scans.clear()
+        self.shutdown(wait=False)
+        self._http.clear()
+        if self._log_files:
+            self._log_files.close()
+        with self._mqtt_lock:
+            if self._mqtt:
+                self._mqtt.disconnect()
+                self._mqtt.loop_stop()
+                self._mqtt = None
+                self._mqtt_connected.clear()
+    
+    def _get_mqtt_client(self, broker: str, port: int) -> mqtt.Client:
+        """获取常驻MQTT客户端，不存在时创建并在后台线程中连接（自动重连）"""
+        with self._mqtt_lock:
+            if self._mqtt is None:
+                client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"reji_{os.getpid()}")
+                client.reconnect_delay_set(min_delay=1, max_delay=30)
+                client.on_connect = self._on_mqtt_connect
+                client.on_disconnect = self._on_mqtt_disconnect
+                client.on_socket_open = self._on_mqtt_socket_open
+                client.connect_async(broker, port, 60)
+                client.loop_start()
+                self._mqtt = client
+            return self._mqtt
+    
+    def _on_mqtt_socket_open(self, client, userdata, sock):
+        """禁用Nagle算法，使小的PUBLISH报文立即发出"""
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (OSError, AttributeError) as e:
+            print(f"[DeviceNotifier] Failed to set TCP_NODELAY on MQTT socket: {e}")
+    
+    def _on_mqtt_connect(self, client, userdata, flags, reason_code, properties):
+        """MQTT连接回调（收到CONNACK），连接成功后才允许发布"""
+        if reason_code.is_failure:
+            print(f"[DeviceNotifier] MQTT connect refused: {reason_code}")
+            return
+        self._mqtt_connected.set()
+    
+    def _on_mqtt_disconnect(self, client, userdata, flags, reason_code, properties):
+        """MQTT断开回调，重连由paho的网络线程自动完成"""
+        self._mqtt_connected.clear()
+        print(f"[DeviceNotifier] MQTT disconnected: {reason_code}, will reconnect")
+    
+    def _emit(self, device_id: str, kind: str, extra: Dict, file_kind: Optional[str] = None):
+        """
+        记录一条通知日志：写入外部logger（如果有）和当天的通知日志文件
+        
+        Args:
+            device_id: 设备ID
+            kind: 写入外部logger时的类型
+            extra: 日志内容字段
+            file_kind: 写入通知日志文件时的类型，默认与 kind 相同
+        """
+        # 如果有外部logger，使用它写入主日志和通知日志文件
         if self.logger:
-            log_data = {
-                "timestamp": timestamp.timestamp(),
-                "type": "device_notification",
-                "code": code,
-                "message": message,
-                "status_code": status_code,
-                "response": response
-            }
-            self.logger.log(device_id, log_data)
+            self.logger.log(device_id, {"timestamp": time.time(), "type": kind, **extra})
+            self.logger.log_raw(device_id, {"type": file_kind or kind, **extra}, kind="notifications")
+            return
         
-        # 同时写入专门的通知日志文件
+        now = time.time()
         log_entry = {
-            "timestamp": timestamp.isoformat(),
+            "timestamp": datetime.fromtimestamp(now),
             "device_id": device_id,
-            "type": "notification_sent",
-            "code": code,
-            "message": message,
-            "status_code": status_code,
-            "response": response
+            "type": file_kind or kind,
+            **extra
         }
         
-        today = timestamp.strftime("%Y-%m-%d")
-        notification_log_file = self.log_dir / f"{today}_notifications.log"
-        
         try:
-            with open(notification_log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+            self._log_files.append_daily(self.log_dir, "_notifications", log_entry, now)
         except Exception as e:
             print(f"Error writing to notification log: {e}")
     
-    def send_session_start(self, device_id: str) -> bool:
-        """发送会计开始通知（code 101）"""
-        return self.notify_device(
+    def _log_notification(self, device_id: str, code: int, message: str, status_code: int, response: str):
+        """记录通知到日志文件"""
+        self._emit(
+            device_id,
+            "device_notification",
+            {"code": code, "message": message, "status_code": status_code, "response": response},
+            file_kind="notification_sent"
+        )
+    
+    def send_session_start(self, device_id: str) -> Future:
+        """发送会计开始通知（code 101），异步执行"""
+        self._flush_scans(device_id)
+        return self._submit(
+            device_id,
+            "session_start",
+            self.notify_device,
             device_id,
             101,
             "スキャンチェック開始"
         )
     
-    def send_session_end(self, device_id: str) -> bool:
-        """发送会计结束通知（code 106）"""
-        return self.notify_device(
+    def send_session_end(self, device_id: str) -> Future:
+        """发送会计结束通知（code 106），异步执行"""
+        # 先把尚在去抖窗口内的扫描通知放入设备的串行队列，保证 102 在 106 之前送达
+        self._flush_scans(device_id)
+        return self._submit(
+            device_id,
+            "session_end",
+            self.notify_device,
             device_id,
             106,
             "スキャンチェック終了"
         )
     
-    def send_product_scan(self, device_id: str) -> bool:
-        """发送扫描商品通知（code 102）"""
-        return self.notify_device(
-            device_id,
-            102,
-            "商品スキャン"
-        )
+    def send_product_scan(self, device_id: str):
+        """
+        发送扫描商品通知（code 102）
+        
+        在 SCAN_DEBOUNCE_SECONDS 窗口内的多次扫描合并为一次请求，请求体带有 count 字段。
+        """
+        with self._scan_lock:
+            pending = self._pending_scans.get(device_id)
+            if pending:
+                timer, count = pending
+                self._pending_scans[device_id] = (timer, count + 1)
+                return
+            
+            timer = threading.Timer(self.SCAN_DEBOUNCE_SECONDS, self._flush_scans, args=(device_id,))
+            timer.daemon = True
+            self._pending_scans[device_id] = (timer, 1)
+            timer.start()
+    
+    def _flush_scans(self, device_id: str):
+        """
+        发送去抖窗口内累计的扫描通知
+        
+        在持有 _scan_lock 时提交：去抖定时器与 session_start/end 同时调用时，
+        后者会等定时器把 102 放入设备的串行队列后才提交自己的通知，顺序不会颠倒。
+        """
+        with self._scan_lock:
+            pending = self._pending_scans.pop(device_id, None)
+            if not pending:
+                return
+            
+            timer, count = pending
+            timer.cancel()
+            self._submit(
+                device_id,
+                "product_scan",
+                self.notify_device,
+                device_id,
+                102,
+                "商品スキャン",
+                {"count": count}
+            )
+
+    def send_mqtt_dismiss(self, device_id: str) -> Future:
+        """向设备发送MQTT dismiss命令，异步执行"""
+        return self._submit(device_id, "mqtt_dismiss", self._publish_mqtt_dismiss, device_id)
+
+    def send_scan_and_dismiss(self, device_id: str) -> Future:
+        """
+        扫描商品时的组合通知：登记去抖的 102 通知，并立即提交 MQTT dismiss
 
-    def send_mqtt_dismiss(self, device_id: str) -> bool:
+        两者走不同通道（HTTP / MQTT），dismiss 通过常驻客户端以 QoS 0 发布、不等待确认，
+        因此不会被扫描通知的 HTTP 请求阻塞。
+        """
+        self.send_product_scan(device_id)
+        return self.send_mqtt_dismiss(device_id)
+
+    def _publish_mqtt_dismiss(self, device_id: str) -> bool:
         """
         向设备发送MQTT dismiss命令
 
@@ -161,8 +429,7 @@ class DeviceNotifier:
         """
         try:
             # 获取设备配置
-            devices_config = self.config_loader.config.get('device', {})
-            device_config = devices_config.get(device_id)
+            device_config = self._devices.get(device_id)
 
             if not device_config:
                 print(f"[DeviceNotifier] Device {device_id} not found in config")
@@ -175,7 +442,7 @@ class DeviceNotifier:
                 return False
 
             # 获取MQTT配置
-            mqtt_config = self.config_loader.config.get('alter_neko', {})
+            mqtt_config = self._mqtt_cfg
             mqtt_broker = mqtt_config.get('mqtt_broker')
             mqtt_port = mqtt_config.get('mqtt_port', 1883)
             mqtt_topic = mqtt_config.get('mqtt_topic', 'display/alert')
@@ -184,35 +451,33 @@ class DeviceNotifier:
                 print(f"[DeviceNotifier] No MQTT broker configured")
                 return False
 
-            # 创建MQTT客户端
-            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"reji_{device_id}")
+            # 获取常驻MQTT客户端
+            client = self._get_mqtt_client(mqtt_broker, mqtt_port)
 
-            try:
-                # 连接到MQTT broker
-                client.connect(mqtt_broker, mqtt_port, 60)
+            # 构建消息
+            encoded_target = self._encoded_targets.get(target_device_id)
+            if encoded_target is None:
+                encoded_target = json.dumps(target_device_id, ensure_ascii=False).encode('utf-8')
+                self._encoded_targets[target_device_id] = encoded_target
+            payload = DISMISS_PAYLOAD_FMT % (encoded_target, time.strftime("%Y-%m-%dT%H:%M:%SZ").encode('ascii'))
 
-                # 构建消息
-                message = {
-                    "text": "",
-                    "command": "dismiss",
-                    "targetDeviceId": target_device_id,
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ")
-                }
+            # 尚未连接（启动或重连中）时稍等连接建立，否则 publish 会直接返回 NO_CONN
+            connected = self._mqtt_connected.is_set() or self._mqtt_connected.wait(self.MQTT_CONNECT_WAIT)
 
-                # 发送消息
-                result = client.publish(mqtt_topic, json.dumps(message, ensure_ascii=False))
+            # 发送消息（QoS 0，不等待broker确认）
+            result = client.publish(mqtt_topic, payload, qos=0)
+            if result.rc == mqtt.MQTT_ERR_NO_CONN and connected and self._mqtt_connected.wait(self.MQTT_CONNECT_WAIT):
+                # 发布时连接刚好断开，重连成功后重发一次
+                result = client.publish(mqtt_topic, payload, qos=0)
 
-                if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                    print(f"[DeviceNotifier] ✅ Dismiss 命令已发送到 {target_device_id}")
-                    self._log_mqtt_dismiss(device_id, target_device_id, "Success")
-                    return True
-                else:
-                    print(f"[DeviceNotifier] ❌ Dismiss 命令发送失败: {result.rc}")
-                    self._log_mqtt_dismiss(device_id, target_device_id, f"Failed: {result.rc}")
-                    return False
-
-            finally:
-                client.disconnect()
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                print(f"[DeviceNotifier] ✅ Dismiss 命令已发送到 {target_device_id}")
+                self._log_mqtt_dismiss(device_id, target_device_id, "Success")
+                return True
+            else:
+                print(f"[DeviceNotifier] ❌ Dismiss 命令发送失败: {result.rc}")
+                self._log_mqtt_dismiss(device_id, target_device_id, f"Failed: {result.rc}")
+                return False
 
         except Exception as e:
             print(f"[DeviceNotifier] Error sending MQTT dismiss: {e}")
@@ -221,32 +486,4 @@ class DeviceNotifier:
 
     def _log_mqtt_dismiss(self, device_id: str, target_device_id: str, status: str):
         """记录MQTT dismiss命令到日志文件"""
-        timestamp = datetime.now()
-
-        # 如果有外部logger，使用它
-        if self.logger:
-            log_data = {
-                "timestamp": timestamp.timestamp(),
-                "type": "mqtt_dismiss",
-                "target_device_id": target_device_id,
-                "status": status
-            }
-            self.logger.log(device_id, log_data)
-
-        # 同时写入专门的通知日志文件
-        log_entry = {
-            "timestamp": timestamp.isoformat(),
-            "device_id": device_id,
-            "type": "mqtt_dismiss",
-            "target_device_id": target_device_id,
-            "status": status
-        }
-
-        today = timestamp.strftime("%Y-%m-%d")
-        notification_log_file = self.log_dir / f"{today}_notifications.log"
-
-        try:
-            with open(notification_log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-        except Exception as e:
-            print(f"Error writing to notification log: {e}")
\ No newline at end of file
+        self._emit(device_id, "mqtt_dismiss", {"target_device_id": target_device_id, "status": status})
@@ -1,9 +1,17 @@
+import time
 import uuid
-import json
+from collections import deque
 from datetime import datetime
-from typing import Dict, Optional, List, Tuple
+from itertools import islice
+from typing import Deque, Dict, FrozenSet, Optional, List, Tuple
 from pathlib import Path
 from .device_notifier import DeviceNotifier
+from ..utils.log_files import LogFileCache
+
+
+def _build_valid_pairs(valid_transitions: Dict[str, List[str]]) -> FrozenSet[Tuple[str, str]]:
+    """把状态转换规则展开为 (旧状态, 新状态) 集合"""
+    return frozenset((old, new) for old, targets in valid_transitions.items() for new in targets)
 
 
 class DeviceState:
@@ -16,7 +24,7 @@ class DeviceState:
         self.session_start: Optional[float] = None
         self.scan_count = 0  # 当前会计的扫描次数
         self.last_update: Optional[float] = None
-        self.state_history: List[Tuple[float, str]] = []
+        self.state_history: Deque[Tuple[float, str]] = deque(maxlen=500)  # 超出长度自动丢弃最旧记录
         # 状态稳定性验证相关
         self.pending_state: Optional[str] = None  # 待确认的状态
         self.pending_count = 0  # 待确认状态的连续检测次数
@@ -36,9 +44,6 @@ class DeviceState:
     def add_to_history(self, timestamp: float, state: str):
         """添加状态到历史记录"""
         self.state_history.append((timestamp, state))
-        # 限制历史记录长度，避免内存问题
-        if len(self.state_history) > 1000:
-            self.state_history = self.state_history[-500:]
 
 
 class DeviceStateManager:
@@ -53,6 +58,9 @@ class DeviceStateManager:
         "over": ["idle"]                  # 结束只能回到空闲
     }
 
+    # 由 VALID_TRANSITIONS 展开的合法转换对，判断时只需一次集合查找
+    _VALID_PAIRS = _build_valid_pairs(VALID_TRANSITIONS)
+
     # 转换到idle需要连续确认的次数（over除外）
     IDLE_CONFIRMATION_COUNT = 5  # 需要连续5次确认
     CONFIRMATION_TIME_WINDOW = 3.0  # 确认时间窗口（秒）
@@ -62,7 +70,13 @@ class DeviceStateManager:
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(exist_ok=True)
         self.logger = logger  # 可选的外部日志器
+        # 有外部logger时状态日志也交给它的写入线程，否则自行写文件
+        self._log_files = None if logger else LogFileCache()
         self.notifier = DeviceNotifier(config_loader, logger) if config_loader else None  # 设备通知器
+        # 状态摘要缓存，只在设备状态发生变化后重建
+        self._status_cache: Optional[Dict] = None
+        self._status_dirty = True
+        self._session_info_cache: Dict[str, Dict] = {}
         
     def update_state(self, device_id: str, detected_state: str, confidence: float, timestamp: float) -> Dict:
         """
@@ -74,6 +88,7 @@ class DeviceStateManager:
         # 初始化设备状态
         if device_id not in self.devices:
             self.devices[device_id] = DeviceState(device_id)
+            self._status_dirty = True
             self._log_state_message(device_id, "初始化设备状态管理")
 
         device = self.devices[device_id]
@@ -128,13 +143,7 @@ class DeviceStateManager:
                             device_id,
                             f"确认超时重置: {device.current_state} -> {detected_state}"
                         )
-                else:
-                    # 继续等待确认
-                    self._log_state_message(
-                        device_id,
-                        f"等待确认: {device.current_state} -> {detected_state} "
-                        f"({device.pending_count}/{self.IDLE_CONFIRMATION_COUNT})"
-                    )
+                # 未达到确认次数时继续等待，中间计数不记录日志（只记录首次检测和最终转换）
             else:
                 # 新的待确认状态
                 device.pending_state = detected_state
@@ -175,123 +184,137 @@ class DeviceStateManager:
             'details': {}
         }
         
-        # 会计开始: 从 idle 或 list 转换到 start 都算开始
+        handler = self._TRANSITION_HANDLERS.get((old_state, new_state), DeviceStateManager._on_state_change)
+        result = handler(self, device, event)
+        # 设备数据已更新完毕，摘要缓存失效
+        self._status_dirty = True
+        self._session_info_cache.pop(device.id, None)
+        return result
+    
+    def _on_session_start(self, device: DeviceState, event: Dict) -> Dict:
+        """会计开始: 从 idle 或 list 转换到 start 都算开始"""
         # 只有在没有活跃会话时才算新的会计开始
-        if new_state == "start" and (old_state == "idle" or (old_state == "list" and not device.session_id)):
-            device.session_id = str(uuid.uuid4())
-            device.session_start = timestamp
-            device.scan_count = 0  # 重置扫描计数
-            
-            event['event_type'] = 'session_start'
-            event['details'] = {
-                'session_id': device.session_id,
-                'start_time': datetime.fromtimestamp(timestamp).isoformat()
-            }
-            
-            self._log_state_message(device.id, f"===== 会计开始 ===== Session: {device.session_id[:8]}...")
-            
-            # 发送会计开始通知（code 101）
-            if self.notifier:
-                self.notifier.send_session_start(device.id)
-            
-        # * -> scan: 扫描商品（只记录状态变化时的一次）
-        elif new_state == "scan" and old_state != "scan":
-            device.scan_count += 1
-
-            event['event_type'] = 'product_scan'
-            event['details'] = {
-                'scan_number': device.scan_count,
-                'session_id': device.session_id
-            }
-
-            self._log_state_message(device.id, f"扫描商品 #{device.scan_count}")
-
-            # 发送扫描商品通知（code 102）
-            if self.notifier:
-                self.notifier.send_product_scan(device.id)
-                # 发送 MQTT dismiss 命令
-                self.notifier.send_mqtt_dismiss(device.id)
-            
-        # scan -> list: 从扫描切换到查看列表
-        elif old_state == "scan" and new_state == "list":
-            event['event_type'] = 'view_list'
-            self._log_state_message(device.id, "查看商品列表")
-            
-        # list -> scan: 从列表切换回扫描
-        elif old_state == "list" and new_state == "scan":
-            device.scan_count += 1
-
-            event['event_type'] = 'product_scan'
-            event['details'] = {
-                'scan_number': device.scan_count,
-                'session_id': device.session_id
-            }
+        if event['old_state'] == "list" and device.session_id:
+            return self._on_state_change(device, event)
+        
+        timestamp = event['timestamp']
+        device.session_id = uuid.uuid4().hex
+        device.session_start = timestamp
+        device.scan_count = 0  # 重置扫描计数
+        
+        event['event_type'] = 'session_start'
+        event['details'] = {
+            'session_id': device.session_id,
+            'start_time': timestamp  # 时间戳（秒），由使用方按需格式化
+        }
+        
+        self._log_state_message(device.id, f"===== 会计开始 ===== Session: {device.session_id[:8]}...")
+        
+        # 发送会计开始通知（code 101）
+        if self.notifier:
+            self.notifier.send_session_start(device.id)
+        return event
+    
+    def _on_product_scan(self, device: DeviceState, event: Dict) -> Dict:
+        """* -> scan: 扫描商品（只记录状态变化时的一次）"""
+        device.scan_count += 1
 
-            self._log_state_message(device.id, f"扫描商品 #{device.scan_count}")
+        event['event_type'] = 'product_scan'
+        event['details'] = {
+            'scan_number': device.scan_count,
+            'session_id': device.session_id
+        }
 
-            # 发送扫描商品通知（code 102）
-            if self.notifier:
-                self.notifier.send_product_scan(device.id)
-                # 发送 MQTT dismiss 命令
-                self.notifier.send_mqtt_dismiss(device.id)
-            
-        # 会话结束（两种情况）：
-        # 1. 正常买单：scan/list -> over
-        # 2. 放弃购物：start/scan/list -> idle
-        elif (new_state == "over" and old_state in ["scan", "list"]) or \
-             (new_state == "idle" and old_state in ["start", "scan", "list"]):
+        self._log_state_message(device.id, f"扫描商品 #{device.scan_count}")
 
-            if device.session_id:
-                duration = timestamp - device.session_start if device.session_start else 0
+        # 发送扫描商品通知（code 102）和 MQTT dismiss 命令
+        if self.notifier:
+            self.notifier.send_scan_and_dismiss(device.id)
+        return event
+    
+    def _on_view_list(self, device: DeviceState, event: Dict) -> Dict:
+        """scan -> list: 从扫描切换到查看列表"""
+        event['event_type'] = 'view_list'
+        self._log_state_message(device.id, "查看商品列表")
+        return event
+    
+    def _on_session_end(self, device: DeviceState, event: Dict) -> Dict:
+        """
+        会话结束（两种情况）：
+        1. 正常买单：scan/list -> over
+        2. 放弃购物：start/scan/list -> idle
+        """
+        old_state, new_state, timestamp = event['old_state'], event['new_state'], event['timestamp']
+        
+        if not device.session_id:
+            # 没有活跃会话但检测到结束状态，记录警告
+            self._log_state_message(
+                device.id,
+                f"警告: 检测到会话结束状态({old_state} -> {new_state})，但没有活跃会话"
+            )
+            return {}
 
-                # 区分结束类型
-                end_type = "completed" if new_state == "over" else "abandoned"
+        duration = timestamp - device.session_start if device.session_start else 0
 
-                event['event_type'] = 'session_end'
-                event['details'] = {
-                    'session_id': device.session_id,
-                    'end_type': end_type,
-                    'duration_seconds': duration,
-                    'total_scans': device.scan_count,
-                    'end_time': datetime.fromtimestamp(timestamp).isoformat()
-                }
+        # 区分结束类型
+        end_type = "completed" if new_state == "over" else "abandoned"
 
-                log_msg = f"===== 会话{'完成' if end_type == 'completed' else '放弃'} ===== "
-                log_msg += f"时长: {duration:.1f}秒, 扫描: {device.scan_count}次"
-                self._log_state_message(device.id, log_msg)
+        event['event_type'] = 'session_end'
+        event['details'] = {
+            'session_id': device.session_id,
+            'end_type': end_type,
+            'duration_seconds': duration,
+            'total_scans': device.scan_count,
+            'end_time': timestamp  # 时间戳（秒），由使用方按需格式化
+        }
 
-                # 无论哪种结束方式，都发送106信号
-                if self.notifier:
-                    self.notifier.send_session_end(device.id)
+        log_msg = f"===== 会话{'完成' if end_type == 'completed' else '放弃'} ===== "
+        log_msg += f"时长: {duration:.1f}秒, 扫描: {device.scan_count}次"
+        self._log_state_message(device.id, log_msg)
 
-                # 重置设备状态
-                device.reset()
-            else:
-                # 没有活跃会话但检测到结束状态，记录警告
-                self._log_state_message(
-                    device.id,
-                    f"警告: 检测到会话结束状态({old_state} -> {new_state})，但没有活跃会话"
-                )
-                return {}
+        # 无论哪种结束方式，都发送106信号
+        if self.notifier:
+            self.notifier.send_session_end(device.id)
 
-        # over -> idle: 不视为任何行为，静默处理
-        elif old_state == "over" and new_state == "idle":
-            # 不产生任何事件，返回空的 event
-            return {}
-        
-        # 其他状态转换
-        else:
-            event['event_type'] = 'state_change'
-            self._log_state_message(device.id, f"状态变化: {old_state} -> {new_state}")
-        
+        # 重置设备状态
+        device.reset()
+        return event
+    
+    def _on_silent(self, device: DeviceState, event: Dict) -> Dict:
+        """over -> idle: 不视为任何行为，静默处理"""
+        return {}
+    
+    def _on_state_change(self, device: DeviceState, event: Dict) -> Dict:
+        """其他状态转换"""
+        event['event_type'] = 'state_change'
+        self._log_state_message(device.id, f"状态变化: {event['old_state']} -> {event['new_state']}")
         return event
     
+    # (旧状态, 新状态) -> 处理函数，未列出的转换按普通状态变化处理
+    _TRANSITION_HANDLERS = {
+        ("idle", "start"): _on_session_start,
+        ("list", "start"): _on_session_start,
+        ("start", "scan"): _on_product_scan,
+        ("list", "scan"): _on_product_scan,
+        ("scan", "list"): _on_view_list,
+        ("scan", "over"): _on_session_end,
+        ("list", "over"): _on_session_end,
+        ("start", "idle"): _on_session_end,
+        ("scan", "idle"): _on_session_end,
+        ("list", "idle"): _on_session_end,
+        ("over", "idle"): _on_silent,
+    }
+    
     def get_device_state(self, device_id: str) -> Optional[DeviceState]:
         """获取设备当前状态"""
         return self.devices.get(device_id)
     
     def get_all_devices_status(self) -> Dict:
-        """获取所有设备的状态摘要"""
+        """获取所有设备的状态摘要（状态未变化时返回缓存的同一份字典，调用方不应修改）"""
+        if not self._status_dirty and self._status_cache is not None:
+            return self._status_cache
+        # 先清除标记再重建，重建期间发生的状态变化会让下次调用重新生成
+        self._status_dirty = False
         status = {}
         for device_id, device in self.devices.items():
             status[device_id] = {
@@ -301,56 +324,63 @@ class DeviceStateManager:
                 'scan_count': device.scan_count,
                 'last_update': device.last_update
             }
+        self._status_cache = status
         return status
     
     def get_device_session_info(self, device_id: str) -> Dict:
-        """获取设备当前会话信息"""
+        """获取设备当前会话信息（状态未变化时返回缓存，调用方不应修改）"""
+        info = self._session_info_cache.get(device_id)
+        if info is not None:
+            return info
+        
         device = self.devices.get(device_id)
         if not device or not device.session_id:
             return {}
 
-        return {
+        info = {
             'session_id': device.session_id,
             'start_time': device.session_start,
             'current_state': device.current_state,
             'scan_count': device.scan_count,
-            'state_history': device.state_history[-10:]  # 最近10个状态
+            'state_history': list(islice(reversed(device.state_history), 10))[::-1]  # 最近10个状态
         }
+        self._session_info_cache[device_id] = info
+        return info
+
+    def close(self):
+        """释放通知器持有的资源"""
+        if self.notifier:
+            self.notifier.close()
+        if self._log_files:
+            self._log_files.close()
 
     def _is_valid_transition(self, old_state: str, new_state: str) -> bool:
         """检查状态转换是否合法"""
-        if old_state not in self.VALID_TRANSITIONS:
-            return False
-        return new_state in self.VALID_TRANSITIONS[old_state]
+        return (old_state, new_state) in self._VALID_PAIRS
     
     def _log_state_message(self, device_id: str, message: str):
         """记录状态消息到日志"""
-        timestamp = datetime.now()
-        
-        # 如果有外部logger，使用它来记录到主日志
+        # 如果有外部logger，使用它来记录到主日志和状态日志文件（便于单独查看）
         if self.logger:
-            log_data = {
-                "timestamp": timestamp.timestamp(),
+            self.logger.log(device_id, {
+                "timestamp": time.time(),
                 "type": "state_message",
                 "message": message
-            }
-            self.logger.log(device_id, log_data)
+            })
+            self.logger.log_raw(device_id, {"type": "state_message", "message": message}, kind="states")
+            return
         
-        # 同时也写入状态日志文件（便于单独查看）
+        now = time.time()
         log_entry = {
-            "timestamp": timestamp.isoformat(),
+            "timestamp": datetime.fromtimestamp(now),
             "device_id": device_id,
             "type": "state_message",
             "message": message
         }
         
-        today = timestamp.strftime("%Y-%m-%d")
-        state_log_file = self.log_dir / f"{today}_states.log"
-        
         try:
-            with open(state_log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+            self._log_files.append_daily(self.log_dir, "_states", log_entry, now)
         except Exception as e:
             # 降级到标准输出
             print(f"[{device_id}] {message}")
-            print(f"Error writing to state log: {e}")
\ No newline at end of file
+            print(f"Error writing to state log: {e}")
@@ -0,0 +1,61 @@
+import ast
+from pathlib import Path
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+
+class OnnxClassifier:
+    """
+    使用 ONNX Runtime 运行导出的YOLO分类模型
+
+    模型由 `yolo export model=models/best.pt format=onnx half=True` 导出，
+    类别名和输入尺寸从ultralytics写入的模型元数据中读取。
+    """
+
+    PROVIDERS = ['CoreMLExecutionProvider', 'CPUExecutionProvider']
+
+    def __init__(self, model_path: str):
+        import onnxruntime as ort  # 可选依赖，只在使用ONNX模型时导入
+
+        available = ort.get_available_providers()
+        providers = [p for p in self.PROVIDERS if p in available]
+        self.session = ort.InferenceSession(str(Path(model_path)), providers=providers)
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float16 if model_input.type == 'tensor(float16)' else np.float32
+        # 导出时固定了 batch=1 的模型需要逐帧推理
+        self.fixed_batch = isinstance(model_input.shape[0], int)
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names: Dict[int, str] = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+        imgsz = ast.literal_eval(metadata['imgsz']) if 'imgsz' in metadata else model_input.shape[2:]
+        self.size = int(imgsz[0]) if isinstance(imgsz, (list, tuple)) else int(imgsz)
+
+    def _preprocess(self, frame: np.ndarray) -> np.ndarray:
+        """与ultralytics分类预处理一致：短边缩放、中心裁剪、BGR转RGB"""
+        h, w = frame.shape[:2]
+        scale = self.size / min(h, w)
+        resized = cv2.resize(frame, (max(self.size, round(w * scale)), max(self.size, round(h * scale))),
+                             interpolation=cv2.INTER_LINEAR)
+        rh, rw = resized.shape[:2]
+        top, left = (rh - self.size) // 2, (rw - self.size) // 2
+        crop = resized[top:top + self.size, left:left + self.size]
+        return cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+
+    def predict(self, frames: List[np.ndarray]) -> np.ndarray:
+        """
+        对一批帧做分类
+
+        Returns:
+            np.ndarray: 形状为 (N, 类别数) 的概率矩阵
+        """
+        batch = np.stack([self._preprocess(f) for f in frames])
+        x = (batch.transpose(0, 3, 1, 2).astype(np.float32) / 255).astype(self.input_dtype)
+
+        if self.fixed_batch:
+            outputs = [self.session.run(None, {self.input_name: x[i:i + 1]})[0] for i in range(len(x))]
+            return np.concatenate(outputs).astype(np.float32)
+        return self.session.run(None, {self.input_name: x})[0].astype(np.float32)
@@ -1,18 +1,28 @@
 import cv2
+import os
 import threading
 import time
-from typing import Optional
+from typing import List, Optional
 import numpy as np
 
+# FFmpeg 拉流参数：TCP 传输、不缓冲、低延迟解码（已在环境变量中设置时不覆盖）
+FFMPEG_CAPTURE_OPTIONS = "rtsp_transport;tcp|fflags;nobuffer|flags;low_delay"
+
 class RTSPStream:
-    def __init__(self, device_id: str, rtsp_url: str):
+    # 采集后将画面短边缩小到该尺寸（保持宽高比），下游去重、共享内存和推理都只处理小图。
+    # 不能小于模型输入尺寸（imgsz），否则分类前又被放大，丢失模型训练时看到的细节
+    FRAME_SHORT_SIDE = 512
+    
+    def __init__(self, device_id: str, rtsp_url: str, frame_short_side: Optional[int] = None):
         self.device_id = device_id
+        self.frame_short_side = frame_short_side or self.FRAME_SHORT_SIDE
         self.rtsp_url = rtsp_url
         self.cap: Optional[cv2.VideoCapture] = None
-        self.current_frame: Optional[np.ndarray] = None
+        # 双缓冲：采集线程写入非读取槽位后切换 _read_idx（int 赋值在GIL下是原子的）
+        self._slots: List[Optional[np.ndarray]] = [None, None]
+        self._read_idx = 0
         self.is_running = False
         self.thread: Optional[threading.Thread] = None
-        self.lock = threading.Lock()
         self.reconnect_delay = 5
         
     def start(self):
@@ -36,7 +46,8 @@ class RTSPStream:
             if self.cap:
                 self.cap.release()
             
-            self.cap = cv2.VideoCapture(self.rtsp_url)
+            os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", FFMPEG_CAPTURE_OPTIONS)
+            self.cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
             self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             
             if not self.cap.isOpened():
@@ -60,8 +71,10 @@ class RTSPStream:
             try:
                 ret, frame = self.cap.read()
                 if ret:
-                    with self.lock:
-                        self.current_frame = frame
+                    frame = self._downscale(frame)
+                    write_idx = 1 - self._read_idx
+                    self._slots[write_idx] = frame
+                    self._read_idx = write_idx
                 else:
                     print(f"[{self.device_id}] Failed to read frame, reconnecting...")
                     self.cap.release()
@@ -73,9 +86,17 @@ class RTSPStream:
                 self.cap = None
                 time.sleep(self.reconnect_delay)
     
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        short_side = min(h, w)
+        if short_side <= self.frame_short_side:
+            return frame
+        scale = self.frame_short_side / short_side
+        return cv2.resize(frame, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    
     def get_frame(self) -> Optional[np.ndarray]:
-        with self.lock:
-            return self.current_frame.copy() if self.current_frame is not None else None
+        """返回最新一帧（不拷贝），调用方不得修改返回的数组"""
+        return self._slots[self._read_idx]
     
     def is_connected(self) -> bool:
-        return self.cap is not None and self.cap.isOpened() and self.current_frame is not None
\ No newline at end of file
+        return self.cap is not None and self.cap.isOpened() and self._slots[self._read_idx] is not None
\ No newline at end of file
@@ -1,69 +1,208 @@
+import functools
+import queue
 import threading
 import time
 import multiprocessing as mp
-from multiprocessing import Queue, Process
+from multiprocessing import Queue, Process, shared_memory
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
 from ultralytics import YOLO
+from .onnx_classifier import OnnxClassifier
 from .rtsp_stream import RTSPStream
 from .device_state import DeviceStateManager
 from ..utils.logger import Logger
 from ..utils.config_loader import ConfigLoader
 
 
-def detector_process(model_path: str, input_queue: Queue, output_queue: Queue):
+# 检测器每次推理最多合并的帧数
+DETECTOR_BATCH_SIZE = 8
+
+
+def _frame_from_ref(shm: shared_memory.SharedMemory, frame_ref) -> np.ndarray:
+    """还原任务中的帧：共享内存槽位 (slot_idx, offset, shape) 或直接传递的 ndarray"""
+    if isinstance(frame_ref, tuple):
+        _, offset, shape = frame_ref
+        return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+    return frame_ref
+
+
+def _probs_to_numpy(result) -> Optional[np.ndarray]:
+    """取出ultralytics分类结果中的概率向量（Probs.cpu()/numpy() 对已是numpy的数据直接返回自身）"""
+    probs = result.probs
+    if probs is None:
+        return None
+    return probs.cpu().numpy().data
+
+
+def _class_name_list(class_names: Dict, count: int) -> List[str]:
+    """按类别ID排列的类别名列表，缺失的类别用 Class_{i} 补齐"""
+    return [class_names.get(i, f"Class_{i}") for i in range(max(count, len(class_names)))]
+
+
+def _build_analysis_from_probs(probs: np.ndarray, names: List[str], timestamp: float) -> Dict:
+    """把一行类别概率转换为分析结果字典"""
+    top1_idx = int(probs.argmax())
+    idxs = np.flatnonzero(probs > 0.01)
+    
+    return {
+        'timestamp': timestamp,
+        'class': names[top1_idx],
+        'class_id': top1_idx,
+        'confidence': float(probs[top1_idx]),
+        'all_probs': dict(zip([names[i] for i in idxs], probs[idxs].tolist()))
+    }
+
+
+def detector_process(model_path: str, input_queue: Queue, output_queue: Queue, shm_name: str,
+                     confidence_threshold: float = 0.0):
     """
     检测器进程函数，在独立进程中运行YOLO模型
+
+    每次从队列中取出最多 DETECTOR_BATCH_SIZE 个任务合并推理；模型只支持单帧输入时
+    （如 batch=1 导出的 CoreML 模型，ultralytics 只推理批次中的第一帧），改为逐帧推理。
+    任务中的帧可以是共享内存槽位 (slot_idx, offset, shape)，也可以是直接传递的 ndarray；
+    任务为 (device_id, frame_ref, timestamp, signature)，结果以
+    (device_id, analysis_result, slot_idx, signature) 返回，主进程据此释放槽位并核对帧指纹；
+    置信度低于 confidence_threshold 的结果不回传（analysis_result 为 None）。
     """
+    shm = None
     try:
-        model = YOLO(str(model_path), task='classify')
+        # 连接共享内存帧缓冲（由主进程负责回收）
+        shm = shared_memory.SharedMemory(name=shm_name)
+        
+        # .onnx 模型使用 ONNX Runtime，其余格式交给ultralytics
+        use_onnx = Path(model_path).suffix == '.onnx'
+        model = OnnxClassifier(model_path) if use_onnx else YOLO(str(model_path), task='classify')
+        class_names = model.names if hasattr(model, 'names') else {}
+        names = _class_name_list(class_names, 0)
+        # 循环外确定推理和取概率的方法，避免每帧重复判断
+        if use_onnx:
+            infer = model.predict
+            extract_probs = None
+        else:
+            infer = functools.partial(model, verbose=False)
+            extract_probs = _probs_to_numpy
         print(f"Detector process {mp.current_process().pid} initialized")
         
-        while True:
+        # 合并推理的帧数上限，发现模型不支持批量推理后降为1
+        batch_size = DETECTOR_BATCH_SIZE
+        stop = False
+        while not stop:
             try:
                 task = input_queue.get(timeout=1)
-                if task is None:  # 停止信号
-                    break
-                
-                device_id, frame, timestamp = task
-                
-                # 分析帧
-                results = model(frame, verbose=False)
-                
-                if results and len(results) > 0:
-                    result = results[0]
-                    
-                    if hasattr(result, 'probs') and result.probs is not None:
-                        probs = result.probs
-                        top1_idx = probs.top1
-                        top1_conf = probs.top1conf.item() if hasattr(probs.top1conf, 'item') else float(probs.top1conf)
-                        
-                        class_names = model.names if hasattr(model, 'names') else {}
-                        class_name = class_names.get(top1_idx, f"Class_{top1_idx}")
-                        
-                        analysis_result = {
-                            'timestamp': timestamp,
-                            'class': class_name,
-                            'class_id': top1_idx,
-                            'confidence': top1_conf,
-                            'all_probs': {class_names.get(i, f"Class_{i}"): float(p) 
-                                        for i, p in enumerate(probs.data.tolist()) if float(p) > 0.01}
-                        }
-                        
-                        output_queue.put((device_id, analysis_result))
-                
             except mp.queues.Empty:
                 continue
+            if task is None:  # 停止信号
+                break
+            
+            # 取出队列中已就绪的任务，合并为一批
+            batch = [task]
+            while len(batch) < batch_size:
+                try:
+                    task = input_queue.get_nowait()
+                except mp.queues.Empty:
+                    break
+                if task is None:
+                    stop = True
+                    break
+                batch.append(task)
+            
+            frames, results = [], []
+            try:
+                # 分析帧
+                frames = [_frame_from_ref(shm, task[1]) for task in batch]
+                results = infer(frames)
+                if len(results) != len(frames):
+                    print(f"Detector process {mp.current_process().pid}: model returned {len(results)} "
+                          f"result(s) for a batch of {len(frames)}, falling back to single-frame inference")
+                    batch_size = 1
+                    results = [infer([frame])[0] for frame in frames]
             except Exception as e:
                 print(f"Error in detector process {mp.current_process().pid}: {e}")
+                results = []
+            
+            for i, (device_id, frame_ref, timestamp, signature) in enumerate(batch):
+                analysis_result = None
+                # 推理出错时 results 为空，仍需归还槽位
+                if results:
+                    try:
+                        probs = extract_probs(results[i]) if extract_probs else results[i]
+                        # 低置信度结果直接丢弃，不构建结果字典也不经队列回传
+                        if probs is not None and probs.max() >= confidence_threshold:
+                            if len(probs) > len(names):
+                                names = _class_name_list(class_names, len(probs))
+                            analysis_result = _build_analysis_from_probs(probs, names, timestamp)
+                    except Exception as e:
+                        print(f"Error in detector process {mp.current_process().pid}: {e}")
+                
+                # 无论成功与否都要归还槽位
+                slot_idx = frame_ref[0] if isinstance(frame_ref, tuple) else None
+                if analysis_result is not None or slot_idx is not None:
+                    output_queue.put((device_id, analysis_result, slot_idx, signature))
+            
+            # 释放对共享内存的视图引用（ultralytics 结果中也保存了原图），否则 shm.close() 会失败
+            del frames, results
                 
     except Exception as e:
         print(f"Failed to initialize detector process: {e}")
     finally:
+        if shm is not None:
+            shm.close()
         print(f"Detector process {mp.current_process().pid} shutting down")
 
 
+class FrameRing:
+    """
+    共享内存帧缓冲池，避免通过队列 pickle 整帧图像
+
+    只在主进程中分配和回收槽位，检测器进程按槽位偏移直接读取。
+    """
+    
+    def __init__(self, slot_count: int, slot_bytes: int):
+        self.slot_count = slot_count
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_count * slot_bytes)
+        self._free = list(range(slot_count))
+        self._lock = threading.Lock()
+    
+    def fits(self, frame: np.ndarray) -> bool:
+        """帧能否放入单个槽位"""
+        return frame.dtype == np.uint8 and frame.nbytes <= self.slot_bytes
+    
+    def store(self, frame: np.ndarray) -> Optional[Tuple[int, int, Tuple[int, ...]]]:
+        """把帧拷贝到空闲槽位，返回 (slot_idx, offset, shape)；没有空闲槽位时返回 None"""
+        with self._lock:
+            if not self._free:
+                return None
+            slot_idx = self._free.pop()
+        offset = slot_idx * self.slot_bytes
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)[:] = frame
+        return slot_idx, offset, frame.shape
+    
+    def release(self, slot_idx: int):
+        with self._lock:
+            self._free.append(slot_idx)
+    
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def frame_signature(frame: np.ndarray) -> int:
+    """计算帧的简易指纹（32x32灰度缩略图的哈希），用于判断画面是否变化"""
+    small = cv2.resize(frame, (32, 32), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return hash(gray.tobytes())
+
+
 class ScreenAnalyzer:
+    # 画面未变化时复用上次识别结果的最长时间（秒），超过后重新推理
+    DEDUP_TTL = 2.0
+    # 共享内存槽位按短边为 input_size、宽高比不超过该值的 BGR 帧分配，更大的帧直接经队列传递
+    FRAME_SLOT_ASPECT = 16 / 9
+    
     def __init__(self, model_path: str = None, analysis_interval: float = None, detector_count: int = None):
         # 加载配置
         config_loader = ConfigLoader()
@@ -74,10 +213,12 @@ class ScreenAnalyzer:
         self.detector_count = detector_count or detection_config.get('detector_count', 5)
         self.confidence_threshold = detection_config.get('confidence_threshold', 0.5)
         self.analysis_interval = analysis_interval or detection_config.get('analysis_interval', 0.5)
+        # 模型输入尺寸（imgsz），采集时画面短边最多缩小到该尺寸
+        self.input_size = detection_config.get('input_size', RTSPStream.FRAME_SHORT_SIDE)
         
         self.streams: Dict[str, RTSPStream] = {}
         self.is_running = False
-        self.threads: Dict[str, threading.Thread] = {}
+        self.monitor_thread: Optional[threading.Thread] = None
         self.logger = Logger()
         self.state_manager = DeviceStateManager(logger=self.logger, config_loader=config_loader)
         
@@ -86,6 +227,11 @@ class ScreenAnalyzer:
         self.output_queue: Optional[Queue] = None
         self.detector_processes: list[Process] = []
         self.result_thread: Optional[threading.Thread] = None
+        self.frame_ring: Optional[FrameRing] = None
+        
+        # 画面去重：设备ID -> (帧指纹, 上次送检时间)，以及设备ID -> (帧指纹, 该帧的识别结果)
+        self._frame_signatures: Dict[str, Tuple[int, float]] = {}
+        self._last_results: Dict[str, Tuple[int, Dict]] = {}
         
         print(f"Initializing ScreenAnalyzer with {self.detector_count} detector processes")
         
@@ -100,12 +246,16 @@ class ScreenAnalyzer:
         # 创建队列
         self.input_queue = mp.Queue(maxsize=self.detector_count * 2)
         self.output_queue = mp.Queue()
+        # 共享内存帧缓冲，槽位数与输入队列长度一致
+        slot_bytes = self.input_size * round(self.input_size * self.FRAME_SLOT_ASPECT) * 3
+        self.frame_ring = FrameRing(self.detector_count * 2, slot_bytes)
         
         # 启动检测器进程
         for _ in range(self.detector_count):
             p = mp.Process(
                 target=detector_process,
-                args=(self.model_path, self.input_queue, self.output_queue),
+                args=(self.model_path, self.input_queue, self.output_queue, self.frame_ring.shm.name,
+                      self.confidence_threshold),
                 daemon=True
             )
             p.start()
@@ -137,6 +287,11 @@ class ScreenAnalyzer:
         # 停止结果处理线程
         if self.result_thread and self.result_thread.is_alive():
             self.result_thread.join(timeout=2)
+        
+        # 释放共享内存帧缓冲
+        if self.frame_ring:
+            self.frame_ring.close()
+            self.frame_ring = None
             
         print("Detector pool stopped")
     
@@ -144,31 +299,41 @@ class ScreenAnalyzer:
         """处理检测结果的线程"""
         while self.is_running:
             try:
-                if not self.output_queue.empty():
-                    device_id, results = self.output_queue.get(timeout=0.1)
-                    
-                    # 只记录置信度高于阈值的结果
-                    if results['confidence'] >= self.confidence_threshold:
-                        # 更新设备状态
-                        state_event = self.state_manager.update_state(
-                            device_id,
-                            results['class'],  # 检测到的状态 (idle/start/scan/list)
-                            results['confidence'],
-                            results['timestamp']
-                        )
-                        
-                        # 如果有状态变化，记录到日志
-                        if state_event:
-                            results['state_event'] = state_event
-                        
-                        self._log_results(device_id, results)
-                              
-            except:
+                device_id, results, slot_idx, signature = self.output_queue.get(timeout=0.5)
+            except queue.Empty:
                 continue
+            
+            try:
+                if slot_idx is not None:
+                    self.frame_ring.release(slot_idx)
+                if results is None:
+                    continue
+                # 缓存识别结果供画面未变化时复用；只缓存与设备当前帧指纹一致的结果，
+                # 画面已变化后才返回的旧帧结果不能再被复用
+                current = self._frame_signatures.get(device_id)
+                if current and current[0] == signature:
+                    self._last_results[device_id] = (signature, dict(results))
+                
+                # 检测器进程只回传置信度高于阈值的结果，直接更新设备状态
+                state_event = self.state_manager.update_state(
+                    device_id,
+                    results['class'],  # 检测到的状态 (idle/start/scan/list)
+                    results['confidence'],
+                    results['timestamp']
+                )
+                
+                # 如果有状态变化，记录到日志
+                if state_event:
+                    results['state_event'] = state_event
+                
+                self._log_results(device_id, results)
+                    
+            except Exception as e:
+                print(f"[{device_id}] Error processing result: {e}")
     
     def add_stream(self, device_id: str, rtsp_url: str):
         if device_id not in self.streams:
-            stream = RTSPStream(device_id, rtsp_url)
+            stream = RTSPStream(device_id, rtsp_url, self.input_size)
             self.streams[device_id] = stream
             print(f"Added stream for device {device_id}")
     
@@ -183,11 +348,12 @@ class ScreenAnalyzer:
         self._start_detector_pool()
         
         # 启动RTSP流
-        for device_id, stream in self.streams.items():
+        for stream in self.streams.values():
             stream.start()
-            thread = threading.Thread(target=self._monitor_device, args=(device_id,), daemon=True)
-            thread.start()
-            self.threads[device_id] = thread
+        
+        # 所有设备共用一个监控线程
+        self.monitor_thread = threading.Thread(target=self._monitor_all, daemon=True)
+        self.monitor_thread.start()
             
         print(f"Started monitoring {len(self.streams)} devices with {self.detector_count} detector processes")
     
@@ -199,41 +365,69 @@ class ScreenAnalyzer:
             stream.stop()
         
         # 停止监控线程
-        for thread in self.threads.values():
-            thread.join(timeout=5)
-        
-        self.threads.clear()
+        if self.monitor_thread:
+            self.monitor_thread.join(timeout=5)
+            self.monitor_thread = None
         
         # 停止检测器池
         self._stop_detector_pool()
         
+        # 关闭设备通知器，写完剩余日志
+        self.state_manager.close()
+        self.logger.close()
+        
         print("Monitoring stopped")
     
-    def _monitor_device(self, device_id: str):
-        """监控设备的线程函数"""
-        stream = self.streams[device_id]
-        frame_count = 0
-        
+    def _monitor_all(self):
+        """监控线程函数：单线程轮询所有设备（RTSP读取已在各自的采集线程中完成，这里只负责取样）"""
         while self.is_running:
-            try:
-                frame = stream.get_frame()
-                
-                if frame is not None:
-                    frame_count += 1
-                    
-                    # 将帧放入队列进行分析
-                    try:
-                        task = (device_id, frame, time.time())
-                        self.input_queue.put(task, timeout=0.1)
-                    except:
-                        # 队列满，跳过这一帧
-                        pass
-                        
-                time.sleep(self.analysis_interval)
-                
-            except Exception as e:
-                print(f"[{device_id}] Error during monitoring: {e}")
+            streams = list(self.streams.items())
+            if not streams:
                 time.sleep(self.analysis_interval)
+                continue
+            # 把一个分析周期均分给各设备，送检时间错开
+            delay = self.analysis_interval / len(streams)
+            for device_id, stream in streams:
+                if not self.is_running:
+                    break
+                try:
+                    self._sample_device(device_id, stream)
+                except Exception as e:
+                    print(f"[{device_id}] Error during monitoring: {e}")
+                time.sleep(delay)
+    
+    def _sample_device(self, device_id: str, stream: RTSPStream):
+        """取设备最新一帧，画面未变化时复用上次结果，否则送入检测队列"""
+        frame = stream.get_frame()
+        if frame is None:
+            return
+        
+        now = time.time()
+        signature = frame_signature(frame)
+        last = self._frame_signatures.get(device_id)
+        cached = self._last_results.get(device_id)
+        
+        if (last and last[0] == signature and now - last[1] < self.DEDUP_TTL
+                and cached and cached[0] == signature):
+            # 画面未变化，复用该画面的识别结果，不占用检测器
+            self.output_queue.put((device_id, dict(cached[1], timestamp=now), None, signature))
+            return
+        
+        # 帧写入共享内存槽位，队列中只传递槽位信息（过大的帧直接传递）
+        frame_ref = self.frame_ring.store(frame) if self.frame_ring.fits(frame) else frame
+        if frame_ref is None:
+            # 没有空闲槽位，跳过这一帧
+            return
+        
+        # 将帧放入队列进行分析
+        try:
+            task = (device_id, frame_ref, now, signature)
+            self.input_queue.put(task, timeout=0.1)
+            self._frame_signatures[device_id] = (signature, now)
+        except:
+            # 队列满，跳过这一帧
+            if isinstance(frame_ref, tuple):
+                self.frame_ring.release(frame_ref[0])
     
     def _log_results(self, device_id: str, results: Dict):
         """记录结果到日志"""
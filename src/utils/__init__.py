@@ -1,4 +1,5 @@
 from .config_loader import ConfigLoader
 from .logger import Logger
+from .log_files import LogFileCache
 
-__all__ = ['ConfigLoader', 'Logger']
\ No newline at end of file
+__all__ = ['ConfigLoader', 'Logger', 'LogFileCache']
\ No newline at end of file
@@ -1,8 +1,14 @@
 import yaml
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
+
+# 优先使用libyaml的C实现，未编译时退回纯Python版本
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
 class ConfigLoader:
+    # 已解析的配置：(路径, 修改时间) -> 配置字典，文件未修改时不再重复解析
+    _cache: Dict[Tuple[str, float], Dict[str, Any]] = {}
+    
     def __init__(self, config_path: str = "config/config.yaml"):
         self.config_path = Path(config_path)
         self.config = self.load_config()
@@ -11,9 +17,15 @@ class ConfigLoader:
         if not self.config_path.exists():
             raise FileNotFoundError(f"Config file not found: {self.config_path}")
         
+        key = (str(self.config_path.resolve()), self.config_path.stat().st_mtime)
+        config = self._cache.get(key)
+        if config is not None:
+            return config
+        
         with open(self.config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=_YamlLoader)
         
+        ConfigLoader._cache[key] = config
         return config
     
     def get_devices(self) -> Dict[str, Dict[str, Any]]:
@@ -0,0 +1,167 @@
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _select_json_lib() -> str:
+    """
+    选择JSON库：orjson > ujson > 标准库 json（orjson、ujson 均为可选依赖）
+
+    可通过环境变量 LOGGER_JSON_LIB=orjson|ujson|json 指定，指定的库不可用时按默认顺序选择。
+    """
+    preferred = os.environ.get("LOGGER_JSON_LIB", "").strip().lower()
+    for name in ([preferred] if preferred else []) + ["orjson", "ujson"]:
+        if name == "json":
+            return name
+        if name in ("orjson", "ujson"):
+            try:
+                __import__(name)
+            except ImportError:
+                continue
+            return name
+    return "json"
+
+
+# 当前使用的JSON库名称
+JSON_LIB = _select_json_lib()
+
+if JSON_LIB == "orjson":
+    import orjson
+
+    def dumps_line(entry: Dict[str, Any]) -> bytes:
+        """将日志条目序列化为以换行结尾的UTF-8字节串（datetime 输出为ISO格式）"""
+        # 与标准库一致，允许非字符串键（如整数类别ID）
+        return orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+
+    def dumps_value(value: Any) -> bytes:
+        """将单个值序列化为UTF-8 JSON字节串（不带换行），用于拼接预编码的日志行"""
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads_line(line: bytes) -> Any:
+        """解析一行JSON日志（bytes 直接解析，无需先解码为 str）"""
+        return orjson.loads(line)
+
+elif JSON_LIB == "ujson":
+    import ujson
+
+    def dumps_value(value: Any) -> bytes:
+        """将单个值序列化为UTF-8 JSON字节串（不带换行），用于拼接预编码的日志行"""
+        return ujson.dumps(value, ensure_ascii=False, escape_forward_slashes=False,
+                           default=_json_default).encode('utf-8')
+
+    def dumps_line(entry: Dict[str, Any]) -> bytes:
+        """将日志条目序列化为以换行结尾的UTF-8字节串（datetime 输出为ISO格式）"""
+        return dumps_value(entry) + b'\n'
+
+    def loads_line(line: bytes) -> Any:
+        """解析一行JSON日志（bytes 直接解析，无需先解码为 str）"""
+        return ujson.loads(line)
+
+else:
+    def dumps_value(value: Any) -> bytes:
+        """将单个值序列化为UTF-8 JSON字节串（不带换行），用于拼接预编码的日志行"""
+        return json.dumps(value, ensure_ascii=False, default=_json_default).encode('utf-8')
+
+    def dumps_line(entry: Dict[str, Any]) -> bytes:
+        """将日志条目序列化为以换行结尾的UTF-8字节串（datetime 输出为ISO格式）"""
+        return dumps_value(entry) + b'\n'
+
+    def loads_line(line: bytes) -> Any:
+        """解析一行JSON日志（bytes 直接解析，无需先解码为 str）"""
+        return json.loads(line)
+
+
+class LogFileCache:
+    """按日期缓存已打开的日志文件句柄，避免每条日志都 open/close"""
+
+    def __init__(self, flush_interval: float = 0.5):
+        self.flush_interval = flush_interval  # 后台刷新间隔（秒）
+        self.lock = threading.Lock()
+        self._handles: Dict[Path, BinaryIO] = {}
+        self._paths: Dict[Tuple[Path, str], Path] = {}
+        # 当前日期（本地时间），只在跨天时重新生成
+        self._day_key: Optional[Tuple[int, int]] = None
+        self._today_str = ""
+        # 后台线程定期刷新缓冲区，写入时只拷贝到内存缓冲
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def append_daily(self, log_dir: Path, suffix: str, entry: Dict[str, Any], now: Optional[float] = None):
+        """
+        以JSON行的形式追加写入当天的日志文件 log_dir/{YYYY-MM-DD}{suffix}.log
+
+        Args:
+            log_dir: 日志目录
+            suffix: 文件名后缀，例如 "_states"
+            entry: 日志条目
+            now: 事件时间（time.time()），省略时取当前时间
+        """
+        line = dumps_line(entry)
+        with self.lock:
+            self._roll_day(time.time() if now is None else now)
+            key = (log_dir, suffix)
+            path = self._paths.get(key)
+            if path is None:
+                path = log_dir / f"{self._today_str}{suffix}.log"
+                self._paths[key] = path
+
+            f = self._handles.get(path)
+            if f is None:
+                f = open(path, 'ab', buffering=64 * 1024)
+                self._handles[path] = f
+            f.write(line)
+
+    def flush(self):
+        """刷新所有缓存的文件句柄"""
+        with self.lock:
+            self._flush_all()
+
+    def close(self):
+        """停止后台刷新线程并关闭所有缓存的文件句柄"""
+        self._stop.set()
+        if self._flusher.is_alive() and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=self.flush_interval * 2)
+        with self.lock:
+            self._close_all()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing log files: {e}")
+
+    def _roll_day(self, now: float):
+        # 日期变化时关闭前一天的文件
+        lt = time.localtime(now)
+        day_key = (lt.tm_year, lt.tm_yday)
+        if day_key != self._day_key:
+            self._close_all()
+            self._paths.clear()
+            self._day_key = day_key
+            self._today_str = f"{lt.tm_year:04d}-{lt.tm_mon:02d}-{lt.tm_mday:02d}"
+
+    def _flush_all(self):
+        for f in self._handles.values():
+            f.flush()
+
+    def _close_all(self):
+        for f in self._handles.values():
+            try:
+                f.close()
+            except Exception as e:
+                print(f"Error closing log file: {e}")
+        self._handles.clear()
@@ -1,64 +1,579 @@
-import json
-from datetime import datetime
-from pathlib import Path
-from typing import Dict, Any
+import atexit
+import io
+import mmap
+import os
+import queue
+import sys
 import threading
+import time
+from array import array
+from collections import defaultdict
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import numpy as np
+from .log_files import dumps_line, dumps_value, loads_line
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖，缺失时不压缩旧日志
+    zstandard = None
+
+# 写入线程的停止信号
+_STOP = object()
+# 事件日志中直接取自 state_event 的字段
+EVENT_FIELDS = ('event_type', 'old_state', 'new_state')
+# 主日志行 {"timestamp":"...","device_id":...,"data":...} 中固定不变的部分
+_MAIN_PREFIX = b'{"timestamp":"'
+_MAIN_DEVICE = b'","device_id":'
+_MAIN_DATA = b',"data":'
+_MAIN_SUFFIX = b'}\n'
+
+
+def _newline_chunks(mm: mmap.mmap, chunk_size: int = 64 * 1024 * 1024) -> Iterator[np.ndarray]:
+    """
+    分块查找映射文件中所有换行符的位置（numpy 向量化比较，代替逐个 find）
+
+    每块的位置数组在产出前已与 mmap 脱离，调用方中途停止迭代时 mmap 也能正常关闭。
+    """
+    size = len(mm)
+    for pos in range(0, size, chunk_size):
+        chunk = np.frombuffer(mm, dtype=np.uint8, count=min(chunk_size, size - pos), offset=pos)
+        found = np.flatnonzero(chunk == 10)
+        del chunk
+        found += pos
+        yield found
+
+
+def _scan_line_offsets(path: str) -> array:
+    """扫描日志文件，返回每一行起始位置的字节偏移"""
+    offsets = array('Q')
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return offsets
+        offsets.append(0)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for found in _newline_chunks(mm):
+                offsets.extend((found + 1).tolist())
+    # 文件以换行结尾时最后一个位置不是新行的开始
+    if offsets[-1] == size:
+        offsets.pop()
+    return offsets
+
+
+def _index_bytes(offsets: array) -> bytes:
+    """偏移数组编码为索引文件内容（每个偏移8字节，小端）"""
+    if sys.byteorder == 'big':
+        offsets = array('Q', offsets)
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+def _compress_logs(paths: List[str]):
+    """把已轮转的日志压缩为 .log.zst 并删除原文件（在后台定时器线程中执行）"""
+    compressor = zstandard.ZstdCompressor(level=3)
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        tmp_path = path + ".zst.tmp"
+        try:
+            with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                compressor.copy_stream(src, dst)
+            os.replace(tmp_path, path + ".zst")
+            os.remove(path)
+        except OSError as e:
+            print(f"Error compressing log file {path}: {e}")
+
+
+def _load_index(idx_path: str) -> array:
+    offsets = array('Q')
+    with open(idx_path, 'rb') as f:
+        offsets.frombytes(f.read())
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return offsets
+
 
 class Logger:
+    BATCH_SIZE = 256  # 每批最多写入的条目数
+    BATCH_WAIT = 0.05  # 等待新条目的超时（秒）
+    FLUSH_INTERVAL = 0.5  # 缓冲区刷新到文件的间隔（秒）
+    BUFFER_LIMIT = 64 * 1024  # 单个文件缓冲区超过该字节数时立即写入
+    MMAP_READ_THRESHOLD = 256 * 1024 * 1024  # 读取日志时超过该大小改用mmap，避免整个文件读入内存
+    COMPRESS_DELAY = 60.0  # 跨天后延迟多少秒压缩前一天的日志（需要安装 zstandard）
+    MAX_PENDING = 10_000  # 队列中最多等待写入的条目数
+    ERROR_REPORT_INTERVAL = 5.0  # 同类写入错误的最短报告间隔（秒），期间的重复错误只计数
+
     def __init__(self, log_dir: str = "log"):
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(exist_ok=True)
-        self.lock = threading.Lock()
-        
+        # 打开文件时直接拼接字符串路径，不再构造 Path 对象
+        self._log_dir_prefix = str(self.log_dir) + os.sep
+        # 调用方只入队，由后台线程统一序列化并批量写入；队列有上限，写入跟不上时丢弃新条目
+        self._queue: queue.Queue = queue.Queue(maxsize=self.MAX_PENDING)
+        self.dropped = 0  # 因队列已满被丢弃的条目数（累计）
+        self._dropped_lock = threading.Lock()
+        self._dropped_reported = 0
+        self._fds: Dict[str, int] = {}
+        # 主日志的行偏移索引 {today}.idx：描述符、主日志当前大小、缓冲区中各行的长度
+        self._idx_fd: Optional[int] = None
+        self._main_size = 0
+        self._main_line_lens: List[int] = []
+        # 每个日志文件（按后缀区分）一块待写缓冲区
+        self._buffers: Dict[str, bytearray] = defaultdict(bytearray)
+        self._today = ""
+        self._device_ids: Dict[str, bytes] = {}
+        # 当前日期字符串及其对应的时间范围 [_day_start, _day_end)
+        self._date_str = ""
+        self._day_start = 0.0
+        self._day_end = 0.0
+        # 当前秒的 YYYY-MM-DDTHH:MM:SS 部分
+        self._ts_sec = -1
+        self._ts_sec_str = ""
+        self._last_flush = time.monotonic()
+        # 错误类别 -> (上次报告时间, 之后被抑制的次数)
+        self._error_reports: Dict[str, Tuple[float, int]] = {}
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
     def log(self, device_id: str, data: Dict[str, Any]):
-        with self.lock:
-            today = datetime.now().strftime("%Y-%m-%d")
-            log_file = self.log_dir / f"{today}.log"
-            
-            log_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "device_id": device_id,
-                "data": data
-            }
-            
-            # 如果有状态事件，创建单独的事件日志
-            if 'state_event' in data:
-                event = data['state_event']
-                event_log_file = self.log_dir / f"{today}_events.log"
-                event_entry = {
-                    "timestamp": datetime.now().isoformat(),
-                    "device_id": device_id,
-                    "event_type": event.get('event_type'),
-                    "old_state": event.get('old_state'),
-                    "new_state": event.get('new_state'),
-                    "details": event.get('details', {})
-                }
-                
+        try:
+            self._queue.put_nowait((device_id, data, time.time(), None))
+        except queue.Full:
+            self._count_dropped()
+
+    def log_raw(self, device_id: str, data: Dict[str, Any], kind: str):
+        """
+        写入单独的分类日志 {today}_{kind}.log（例如 states、notifications）
+
+        与主日志不同，data 中的字段直接展开到日志条目中，不包在 "data" 下。
+        """
+        try:
+            self._queue.put_nowait((device_id, data, time.time(), kind))
+        except queue.Full:
+            self._count_dropped()
+
+    def _count_dropped(self):
+        # 只在队列已满时才会走到这里，加锁保证计数准确
+        with self._dropped_lock:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待此前入队的日志全部写入文件，超时返回 False"""
+        if not self._writer.is_alive():
+            return False
+        done = threading.Event()
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(max(0.0, deadline - time.monotonic()))
+
+    def close(self):
+        """写完队列中剩余的日志并关闭文件"""
+        if self._writer.is_alive():
+            # 控制信号不能丢弃，队列满时等待写入线程腾出空间；写入线程卡住时不能无限等待
+            try:
+                self._queue.put(_STOP, timeout=5)
+            except queue.Full:
+                print("Logger writer is not draining the queue, skipping remaining log entries")
+            self._writer.join(timeout=5)
+
+    def _writer_loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.BATCH_WAIT)
+            except queue.Empty:
+                self._maybe_flush()
+                continue
+
+            stop = item is _STOP
+            # flush() 放入的 Event：之前的条目全部写入文件后通知调用方
+            barrier = item if isinstance(item, threading.Event) else None
+            batch = [] if stop or barrier else [item]
+            while not stop and barrier is None and len(batch) < self.BATCH_SIZE:
                 try:
-                    with open(event_log_file, 'a', encoding='utf-8') as f:
-                        f.write(json.dumps(event_entry, ensure_ascii=False) + '\n')
-                except Exception as e:
-                    print(f"Error writing to event log: {e}")
-            
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    barrier = item
+                else:
+                    batch.append(item)
+
+            if batch:
+                self._write_batch(batch)
+                self._maybe_flush()
+            if barrier is not None:
+                self._flush_all()
+                barrier.set()
+            if stop:
+                self._flush_all()
+                self._close_fds()
+                return
+
+    def _write_batch(self, batch: List):
+        # 按目标文件（日期, 后缀）分组，每个文件只写一次
+        files: Dict[Tuple[str, str], List[bytes]] = defaultdict(list)
+
+        for device_id, data, ts, kind in batch:
+            stamp = self._format_ts(ts)
+            today = self._date_for(ts)
+
+            if kind:
+                try:
+                    files[(today, f"_{kind}")].append(dumps_line({"timestamp": stamp, "device_id": device_id, **data}))
+                except (TypeError, ValueError) as e:
+                    self._report_error("serialize", f"Error serializing {kind} log entry for {device_id}: {e}")
+                continue
+
+            try:
+                # 固定的键名直接拼接预编码的字节，只序列化 data
+                main_line = b"".join((
+                    _MAIN_PREFIX, stamp.encode('ascii'),
+                    _MAIN_DEVICE, self._encoded_device_id(device_id),
+                    _MAIN_DATA, dumps_value(data), _MAIN_SUFFIX
+                ))
+                # 如果有状态事件，同时写入单独的事件日志（直接取自同一份数据）
+                event = data.get('state_event')
+                if event:
+                    event_line = dumps_line({
+                        "timestamp": stamp,
+                        "device_id": device_id,
+                        **{k: event.get(k) for k in EVENT_FIELDS},
+                        "details": event.get('details', {})
+                    })
+                    files[(today, "_events")].append(event_line)
+            except (TypeError, ValueError) as e:
+                self._report_error("serialize", f"Error serializing log entry for {device_id}: {e}")
+                continue
+            files[(today, "")].append(main_line)
+
+        for (today, suffix), lines in files.items():
+            buf = self._buffer_for(today, suffix)
+            buf += b"".join(lines)
+            if not suffix:
+                self._main_line_lens.extend(map(len, lines))
+            if len(buf) >= self.BUFFER_LIMIT:
+                self._flush_buffer(suffix)
+
+    def _report_error(self, kind: str, message: str):
+        """
+        报告写入线程中的错误，同类错误每 ERROR_REPORT_INTERVAL 秒最多输出一次
+
+        磁盘写满、权限错误等情况下每批都会失败，不限频会持续刷屏并拖慢写入线程。
+        """
+        now = time.monotonic()
+        last, suppressed = self._error_reports.get(kind, (None, 0))
+        if last is not None and now - last < self.ERROR_REPORT_INTERVAL:
+            self._error_reports[kind] = (last, suppressed + 1)
+            return
+        self._error_reports[kind] = (now, 0)
+        if suppressed:
+            message += f" ({suppressed} similar error(s) suppressed)"
+        print(message)
+
+    def _encoded_device_id(self, device_id: str) -> bytes:
+        """设备ID的JSON编码（含引号和转义），按设备缓存"""
+        encoded = self._device_ids.get(device_id)
+        if encoded is None:
+            encoded = dumps_value(device_id)
+            self._device_ids[device_id] = encoded
+        return encoded
+
+    def _format_ts(self, ts: float) -> str:
+        """时间戳格式化为本地时间ISO字符串（精确到微秒），同一秒内只调用一次 localtime"""
+        sec = int(ts)
+        if sec != self._ts_sec:
+            t = time.localtime(sec)
+            self._ts_sec = sec
+            self._ts_sec_str = (f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}"
+                                f"T{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}")
+        # 四舍五入到微秒（避免 .8 变成 .799999），不向秒进位
+        return f"{self._ts_sec_str}.{min(int((ts - sec) * 1e6 + 0.5), 999999):06d}"
+
+    def _date_for(self, ts: float) -> str:
+        """时间戳对应的本地日期字符串，同一天内直接返回缓存"""
+        if self._day_start <= ts < self._day_end:
+            return self._date_str
+        t = time.localtime(ts)
+        self._date_str = f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}"
+        self._day_start = time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1))
+        self._day_end = time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+        return self._date_str
+
+    def _buffer_for(self, today: str, suffix: str) -> bytearray:
+        # 跨天后晚到的前一天条目写入当天文件，前一天的文件不再打开（可能已被压缩）
+        if today > self._today:
+            # 日期变化时先写完并关闭前一天的文件
+            self._flush_all()
+            self._close_fds()
+            previous, self._today = self._today, today
+            if previous:
+                self._schedule_compress(previous)
+        return self._buffers[suffix]
+
+    def _schedule_compress(self, date: str):
+        """延迟 COMPRESS_DELAY 秒后在后台压缩该日期由本 Logger 写入的日志"""
+        if zstandard is None:
+            return
+        paths = [f"{self._log_dir_prefix}{date}{suffix}.log" for suffix in list(self._buffers)]
+        # 行偏移索引只对未压缩的日志有效
+        idx_path = f"{self._log_dir_prefix}{date}.idx"
+        if os.path.exists(idx_path):
+            try:
+                os.remove(idx_path)
+            except OSError as e:
+                self._report_error("index", f"Error removing log index {idx_path}: {e}")
+        timer = threading.Timer(self.COMPRESS_DELAY, _compress_logs, args=(paths,))
+        timer.daemon = True
+        timer.start()
+
+    def _maybe_flush(self):
+        """距上次刷新超过 FLUSH_INTERVAL 时把缓冲区写入文件"""
+        now = time.monotonic()
+        if now - self._last_flush < self.FLUSH_INTERVAL:
+            return
+        self._flush_all()
+        dropped = self.dropped
+        if dropped != self._dropped_reported:
+            self._dropped_reported = dropped
+            self._report_error("dropped", f"Log queue full, {dropped} entries dropped so far")
+
+    def _flush_all(self):
+        self._last_flush = time.monotonic()
+        for suffix in list(self._buffers):
+            self._flush_buffer(suffix)
+
+    def _flush_buffer(self, suffix: str):
+        """把一个文件的缓冲区一次性写入（通常只有一次write系统调用）"""
+        buf = self._buffers.get(suffix)
+        if not buf:
+            return
+        try:
+            fd = self._get_fd(suffix)
+            with memoryview(buf) as view:
+                written = 0
+                while written < len(view):
+                    written += os.write(fd, view[written:])
+            if not suffix:
+                self._append_index()
+        except OSError as e:
+            self._report_error("write", f"Error writing to log: {e}")
+            # 常驻描述符出错后丢弃，下次重新打开文件
+            self._close_fds()
+        buf.clear()
+        if not suffix:
+            self._main_line_lens.clear()
+
+    def _append_index(self):
+        """把刚写入主日志的各行起始偏移追加到索引文件"""
+        offsets = array('Q')
+        pos = self._main_size
+        for n in self._main_line_lens:
+            offsets.append(pos)
+            pos += n
+        self._main_size = pos
+        os.write(self._idx_fd, _index_bytes(offsets))
+
+    def _open_index(self, main_fd: int):
+        """打开当天主日志的索引文件，缺失或与日志不一致时按现有日志重建"""
+        self._main_size = os.fstat(main_fd).st_size
+        idx_path = f"{self._log_dir_prefix}{self._today}.idx"
+        log_path = f"{self._log_dir_prefix}{self._today}.log"
+        try:
+            valid = self._index_matches(_load_index(idx_path), log_path)
+        except FileNotFoundError:
+            valid = self._main_size == 0
+        if not valid:
+            with open(idx_path, 'wb') as f:
+                f.write(_index_bytes(_scan_line_offsets(log_path)))
+        self._idx_fd = os.open(idx_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    @staticmethod
+    def _index_matches(offsets: array, log_path: str) -> bool:
+        """索引的最后一个偏移应当恰好指向日志文件的最后一行"""
+        size = os.path.getsize(log_path)
+        if not offsets:
+            return size == 0
+        last = offsets[-1]
+        if last >= size:
+            return False
+        with open(log_path, 'rb') as f:
+            f.seek(last - 1 if last else 0)
+            tail = f.read()
+        if last:
+            if not tail.startswith(b'\n'):
+                return False
+            tail = tail[1:]
+        # 最后一个偏移之后只能剩下一行
+        return b'\n' not in tail[:-1]
+
+    def _get_fd(self, suffix: str) -> int:
+        fd = self._fds.get(suffix)
+        if fd is None:
+            # O_APPEND 保证每次 write 都原子地追加到文件末尾，缓冲由 _buffers 负责。
+            # 不用 os.posix_fallocate 预分配：它会增大文件长度，O_APPEND 的写入会落在预分配区域之后，
+            # 读取方也会读到未写入的零字节
+            fd = os.open(f"{self._log_dir_prefix}{self._today}{suffix}.log",
+                         os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self._fds[suffix] = fd
+            if not suffix:
+                self._open_index(fd)
+        return fd
+
+    def _close_fds(self):
+        fds = list(self._fds.values())
+        if self._idx_fd is not None:
+            fds.append(self._idx_fd)
+        for fd in fds:
             try:
-                with open(log_file, 'a', encoding='utf-8') as f:
-                    f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-            except Exception as e:
-                print(f"Error writing to log: {e}")
-    
+                os.close(fd)
+            except OSError as e:
+                self._report_error("close", f"Error closing log file: {e}")
+        self._fds.clear()
+        self._idx_fd = None
+
     def get_logs_for_date(self, date: str) -> list:
-        log_file = self.log_dir / f"{date}.log"
-        
-        if not log_file.exists():
+        # 先把写入线程中尚未落盘的日志写入文件
+        self.flush()
+
+        log_file = self._find_log(date)
+        if log_file is None:
             return []
-        
+
         logs = []
+        skipped = 0
         try:
-            with open(log_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():
-                        logs.append(json.loads(line))
+            lines = [line for line in self._read_lines(log_file) if line.strip()]
+            if not lines:
+                return []
+            try:
+                # 拼成一个JSON数组一次解析，解析器内部循环代替逐行调用
+                return loads_line(b"[" + b",".join(lines) + b"]")
+            except ValueError:
+                pass  # 有不完整或损坏的行，退回逐行解析
+            for line in lines:
+                try:
+                    logs.append(loads_line(line))
+                except ValueError:
+                    # 读取时不加锁，可能读到写入线程正在追加的半行，跳过即可
+                    skipped += 1
         except Exception as e:
             print(f"Error reading log file: {e}")
-        
-        return logs
\ No newline at end of file
+        if skipped:
+            print(f"Skipped {skipped} unparsable line(s) in {log_file}")
+
+        return logs
+
+    def get_logs_range(self, date: str, start: int, count: int) -> list:
+        """
+        按行号读取某天主日志中的第 [start, start + count) 条
+
+        通过 {date}.idx 中的行偏移直接定位，不扫描整个文件；索引缺失或过期时临时重新扫描。
+        """
+        log_path = f"{self._log_dir_prefix}{date}.log"
+        self.flush()
+
+        if count <= 0:
+            return []
+        if not os.path.exists(log_path):
+            # 已压缩的日志没有索引，只能顺序解压到所需位置
+            return list(islice(self.iter_logs_for_date(date), start, start + count))
+
+        try:
+            offsets = _load_index(f"{self._log_dir_prefix}{date}.idx")
+            if not self._index_matches(offsets, log_path):
+                offsets = _scan_line_offsets(log_path)
+        except FileNotFoundError:
+            offsets = _scan_line_offsets(log_path)
+
+        logs = []
+        stop = min(start + count, len(offsets))
+        if start >= stop:
+            return logs
+        try:
+            with open(log_path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for i in range(start, stop):
+                        end = offsets[i + 1] if i + 1 < len(offsets) else len(mm)
+                        line = mm[offsets[i]:end]
+                        if not line.strip():
+                            continue
+                        try:
+                            logs.append(loads_line(line))
+                        except ValueError:
+                            continue
+        except Exception as e:
+            print(f"Error reading log file: {e}")
+
+        return logs
+
+    def iter_logs_for_date(self, date: str) -> Iterator[Dict[str, Any]]:
+        """
+        逐条读取某天的主日志（生成器）
+
+        文件通过 mmap 按行解析，内存占用与文件大小无关；只需筛选部分条目（如某个设备）时
+        应优先使用本方法而不是 get_logs_for_date。无法解析的行会被跳过。
+        """
+        self.flush()
+
+        log_file = self._find_log(date)
+        if log_file is None:
+            return
+
+        for line in self._read_lines(log_file, stream=True):
+            if not line.strip():
+                continue
+            try:
+                yield loads_line(line)
+            except ValueError:
+                continue
+
+    def _find_log(self, date: str) -> Optional[Path]:
+        """某天的主日志文件：未压缩的 .log 优先，其次是压缩后的 .log.zst"""
+        log_file = self.log_dir / f"{date}.log"
+        if log_file.exists():
+            return log_file
+        zst_file = self.log_dir / f"{date}.log.zst"
+        if zst_file.exists():
+            return zst_file
+        return None
+
+    def _read_lines(self, log_file: Path, stream: bool = False) -> Iterator[bytes]:
+        """
+        按行读取日志文件（bytes）：小文件整体读入后 splitlines，大文件用 mmap 逐行切分
+
+        stream 为 True 时总是使用 mmap，不把文件整体读入内存；.zst 文件边解压边读取。
+        """
+        if log_file.suffix == '.zst':
+            if zstandard is None:
+                raise RuntimeError(f"zstandard is required to read {log_file}")
+            with open(log_file, 'rb') as f:
+                with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                    for line in io.BufferedReader(reader, 64 * 1024):
+                        yield line.rstrip(b'\n')
+            return
+
+        with open(log_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            if not stream and size < self.MMAP_READ_THRESHOLD:
+                yield from f.read().splitlines()
+                return
+            # 映射文件按行切分，不把整个文件读入内存
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = 0
+                for found in _newline_chunks(mm):
+                    for nl in found.tolist():
+                        if nl > start:
+                            yield mm[start:nl]
+                        start = nl + 1
+                if start < size:
+                    yield mm[start:size]